@@ -1,7 +1,8 @@
 """
 Common (generic) functions that can be imported by any script/module.
 """
-import re
+import functools
+import ipaddress
 
 
 def parse_interface_name(interface_name):
@@ -10,12 +11,53 @@ def parse_interface_name(interface_name):
     and the interface ID.  Use for generating RESTCONF URLs requiring an
     interface specifier.
 
+    Interface names are made up of the interface type (non-digits) followed
+    by the interface ID (starting with a digit), e.g. "GigabitEthernet1/0/1",
+    so the name is split at the first digit.
+
     :param interface_name: String - name of the interface to parse
     :return: Tuple of (interface type, interface ID)
     """
-    interface_pattern = r"^(\D+)(\d+.*)$"
-    interface_regex = re.compile(interface_pattern)
+    if not isinstance(interface_name, str):
+        interface_name = str(interface_name)
+
+    for position, character in enumerate(interface_name):
+        if character.isdigit():
+            # An interface type is required before the interface ID
+            if position == 0:
+                break
+            return interface_name[:position], interface_name[position:]
+
+    raise ValueError(f"Unable to parse interface name '{interface_name}'")
+
+
+@functools.lru_cache(maxsize=4096)
+def get_management_ip(primary_ip):
+    """
+    Extract the address component of a device's primary IPv4 address. The
+    result is cached, as webhooks for the same device will often arrive
+    together. The primary IP is the cache key, so a change of the device's
+    primary IP address results in a new lookup.
 
-    interface_type, interface_id = interface_regex.match(str(interface_name)).groups()
+    :param primary_ip: String - primary IPv4 address in CIDR notation
+    :return: String - IPv4 address without the prefix length
+    """
+    return str(ipaddress.IPv4Interface(primary_ip).ip)
+
+
+@functools.lru_cache(maxsize=2048)
+def build_interface_url(mgmt_ip, interface_type, interface_id):
+    """
+    Generate the base RESTCONF URL for an interface on a device. The YANG
+    model is expecting a list reference to identify the interface in the
+    format <interface_type>=<interface_id>. The result is cached, as the same
+    interfaces are often targeted by several webhooks in a row.
+
+    :param mgmt_ip: String - management IP address of the device
+    :param interface_type: String - interface type, e.g. "GigabitEthernet"
+    :param interface_id: String - interface ID, e.g. "1/0/1"
+    :return: String - base RESTCONF URL for the interface
+    """
+    return f"https://{mgmt_ip}/restconf/data/Cisco-IOS-XE-native:native/interface/" \
+           f"{interface_type}={interface_id}"
 
-    return interface_type, interface_id
@@ -1,15 +1,25 @@
 """
 Docstring.
 """
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+import httpx
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3 import disable_warnings, Retry
-import pynetbox
 from credentials import (NETBOX_URL,
                          NETBOX_TOKEN,
                          DEVICE_USERNAME,
                          DEVICE_PASSWORD)
 
+# Log level for the webhook listener. Use logging.DEBUG to include the
+# RESTCONF URLs, payloads and responses in the output.
+LOG_LEVEL = logging.INFO
+
+# Log message format, including the name of the module which logged it
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
 # Boolean - perform TLS validation when consuming remote APIs? For production
 # use, this should be set to True!
 TLS_VERIFY = False
@@ -17,28 +27,86 @@ TLS_VERIFY = False
 # Configure a retry/backoff strategy for RESTCONF calls. Sometimes the NETCONF/
 # RESTCONF datastore is locked while configuration synchronization is being
 # performed, which will result in an HTTP 409 status code being returned.
-# Instead of timing out and failing, the Retry configuration will continue
-# attempting the API request for (total) retries with an incremental backoff
-# specified by (backoff_factor).
-# The (status_forcelist) is a list containing status codes which should be
-# retried, and (method_whitelist) instructs Python to perform retries for
-# the specified HTTP verbs.
-RESTCONF_RETRY_CONFIG = Retry(
-    total=8,
-    status_forcelist=[409],
-    method_whitelist=["PATCH", "POST", "PUT"],
-    backoff_factor=1
-)
-
-# When creating an HTTP session, these are the headers that will be included
+# Instead of timing out and failing, the RESTCONF client will continue
+# attempting the API request for (RESTCONF_RETRY_TOTAL) retries with an
+# incremental backoff specified by (RESTCONF_BACKOFF_FACTOR), up to a maximum
+# of (RESTCONF_BACKOFF_MAX) seconds between attempts.
+# (RESTCONF_RETRY_STATUS) contains the status codes which should be retried,
+# and (RESTCONF_RETRY_METHODS) the HTTP verbs for which retries are performed.
+# DELETE is included as enabling an interface or removing an address is
+# performed with an HTTP DELETE, which can hit the same locked datastore.
+RESTCONF_RETRY_TOTAL = 8
+RESTCONF_RETRY_STATUS = frozenset([409])
+RESTCONF_RETRY_METHODS = frozenset(["DELETE", "PATCH", "POST", "PUT"])
+RESTCONF_BACKOFF_FACTOR = 1
+RESTCONF_BACKOFF_MAX = 120
+
+# Number of times to retry a failed connection attempt to a device
+RESTCONF_CONNECT_RETRIES = 3
+
+# Timeouts (in seconds) for RESTCONF calls. Without a timeout, an unresponsive
+# device would hold up the webhook listener indefinitely.
+RESTCONF_TIMEOUT = httpx.Timeout(10.0, connect=3.05)
+
+# Number of worker threads available for sending independent requests (such
+# as the status/description/MTU RESTCONF calls for an interface) in parallel.
+# The pool is bounded, so that a burst of webhooks waits for a free worker
+# rather than opening an unlimited number of connections to the devices.
+IO_WORKERS = 64
+
+# Connection pool limits for the RESTCONF client. HTTP/2 is used when the
+# device supports it, so parallel requests to the same device are multiplexed
+# over a single connection. When every connection is in use, further requests
+# wait for one to become available.
+RESTCONF_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+
+# NetBox may send several identical webhooks in quick succession (for example
+# during bulk edits). A webhook identical to one received within the last
+# DUPLICATE_WEBHOOK_TTL seconds is acknowledged without being processed again.
+# Up to DUPLICATE_WEBHOOK_MAX_ENTRIES recent webhooks are remembered.
+DUPLICATE_WEBHOOK_TTL = 5
+DUPLICATE_WEBHOOK_MAX_ENTRIES = 10_000
+
+# Interface details retrieved from NetBox are cached for INTERFACE_CACHE_TTL
+# seconds, so that several webhooks for the same interface (for example IP
+# address changes during a bulk edit) need only one NetBox lookup. Up to
+# INTERFACE_CACHE_MAX_ENTRIES interfaces are cached.
+INTERFACE_CACHE_TTL = 3
+INTERFACE_CACHE_MAX_ENTRIES = 8192
+
+# When creating an HTTP client, these are the headers that will be included
 # for every request. Code duplication is reduced as these headers will be
-# attached to a requests.Session() object, meaning that scripts do not need
+# attached to an httpx.Client() object, meaning that scripts do not need
 # to define headers for every request.
 RESTCONF_HEADERS = {
     "Content-Type": "application/yang-data+json",
     "Accept": "application/yang-data+json"
 }
 
+# Retry/backoff strategy for NetBox API calls. A reverse proxy in front of
+# NetBox may briefly return a 502/503/504 while NetBox workers are restarting
+# or busy, so retry these a few times with a short backoff. Interface details
+# are retrieved with a GraphQL query sent as an HTTP POST. The query only reads
+# data, so POST is safe to retry and is allowed in addition to GET.
+NETBOX_RETRY_CONFIG = Retry(
+    total=3,
+    status_forcelist=[502, 503, 504],
+    allowed_methods=frozenset(["GET", "POST"]),
+    backoff_factor=0.2
+)
+
+# NetBox GraphQL API endpoint. Used to retrieve only the fields the webhook
+# handlers need rather than the complete REST API representation.
+NETBOX_GRAPHQL_URL = f"{NETBOX_URL.rstrip('/')}/graphql/"
+
+# Timeout (in seconds) for NetBox API calls as a (connect, read) tuple
+NETBOX_TIMEOUT = (3.05, 10)
+
+# Number of pooled (keep-alive) connections that the NetBox HTTP session will
+# hold open. Reusing connections avoids a new TCP + TLS handshake for every
+# NetBox API call.
+NETBOX_POOL_SIZE = 20
+
 
 def conditionally_disable_tls_warnings():
     """
@@ -53,50 +121,96 @@ def conditionally_disable_tls_warnings():
         disable_warnings()
 
 
-def create_restconf_session():
+class RestconfRetryTransport(httpx.HTTPTransport):
     """
-    Initialize a Python requests.Session() object with "extra" options such
-    as HTTP retry / incremental backoff. The Session() object also will
-    set default values for authentication and header values such as
-    Content-Type or Accept.
+    httpx transport which retries RESTCONF requests that fail with one of the
+    RESTCONF_RETRY_STATUS codes. httpx itself only retries failed connection
+    attempts, so status code retries with an incremental backoff are handled
+    here.
+    """
+    def handle_request(self, request):
+        for retry in range(RESTCONF_RETRY_TOTAL):
+            response = super().handle_request(request)
 
-    Once the session has been created, perform any normal urllib3/requests
-    verbs against the session to take advantage of the configured settings.
+            if (response.status_code not in RESTCONF_RETRY_STATUS
+                    or request.method not in RESTCONF_RETRY_METHODS):
+                return response
 
-    :return: requests.Session() object
-    """
-    http_adapter = HTTPAdapter(max_retries=RESTCONF_RETRY_CONFIG)
-    http_session = requests.Session()
-    http_session.mount("https://", http_adapter)
-    http_session.mount("http://", http_adapter)
-    http_session.auth = (DEVICE_USERNAME, DEVICE_PASSWORD)
-    http_session.headers = RESTCONF_HEADERS
-    http_session.verify = TLS_VERIFY
+            # Honor a Retry-After header sent by the device, otherwise retry
+            # immediately the first time and back off incrementally after that
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                backoff = int(retry_after)
+            elif retry:
+                backoff = RESTCONF_BACKOFF_FACTOR * (2 ** (retry - 1))
+            else:
+                backoff = 0
+
+            response.close()
+            if backoff:
+                time.sleep(min(backoff, RESTCONF_BACKOFF_MAX))
+
+        # Every retry has been used, so return the final response as it is
+        return super().handle_request(request)
 
-    return http_session
 
+def create_restconf_client():
+    """
+    Initialize a Python httpx.Client() object with "extra" options such
+    as HTTP/2, connection pooling and HTTP retry / incremental backoff. The
+    Client() object also will set default values for authentication, timeouts
+    and header values such as Content-Type or Accept.
+
+    Once the client has been created, perform any normal httpx verbs against
+    the client to take advantage of the configured settings.
 
-def create_netbox_api():
+    :return: httpx.Client() object
     """
-    Initialize a pynetbox API object and attach an HTTP session object to
-    specify whether TLS validation should be performed.
+    # When a transport is supplied to the client, the TLS, HTTP/2 and pooling
+    # options must be set on the transport itself.
+    http_transport = RestconfRetryTransport(verify=TLS_VERIFY,
+                                            http2=True,
+                                            limits=RESTCONF_LIMITS,
+                                            retries=RESTCONF_CONNECT_RETRIES)
+    http_client = httpx.Client(transport=http_transport,
+                               auth=(DEVICE_USERNAME, DEVICE_PASSWORD),
+                               headers=RESTCONF_HEADERS,
+                               timeout=RESTCONF_TIMEOUT)
 
-    :return: pynetbox API object
+    return http_client
+
+
+def create_netbox_session():
     """
-    # Initialize the pynetbox API object
-    netbox = pynetbox.api(url=NETBOX_URL, token=NETBOX_TOKEN)
+    Initialize a Python requests.Session() object for the NetBox API. The
+    webhook handlers only need a few interface fields, which are retrieved
+    directly from the NetBox GraphQL API (see netbox_batcher.py) rather than
+    through an API client library which builds objects for every field of the
+    response.
+
+    The session sets the API token and TLS validation option, and uses a
+    pooled HTTPAdapter so that consecutive NetBox lookups reuse the same
+    keep-alive connection.
 
-    # pynetbox does not support TLS validation enable/disable functionality
-    # but does accept an optional Session object.  Use this to specify
-    # the TLS validation option and attach the Session object to the
-    # pynetbox instance.
+    :return: requests.Session() object
+    """
+    http_adapter = HTTPAdapter(pool_connections=NETBOX_POOL_SIZE,
+                               pool_maxsize=NETBOX_POOL_SIZE,
+                               max_retries=NETBOX_RETRY_CONFIG)
     api_session = requests.Session()
+    api_session.mount("https://", http_adapter)
+    api_session.mount("http://", http_adapter)
+    api_session.headers.update({
+        "Authorization": f"Token {NETBOX_TOKEN}",
+        "Accept": "application/json"
+    })
     api_session.verify = TLS_VERIFY
-    netbox.http_session = api_session
 
-    return netbox
+    return api_session
 
-# restconf_session and/or netbox_api should be imported by scripts requiring
-# access to RESTCONF sessions or the Netbox API.
-restconf_session = create_restconf_session()
-netbox_api = create_netbox_api()
+# restconf_client and/or netbox_session should be imported by scripts requiring
+# access to RESTCONF devices or the Netbox API. io_executor is a shared thread
+# pool for scripts which need to send independent requests in parallel.
+restconf_client = create_restconf_client()
+netbox_session = create_netbox_session()
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS)
@@ -0,0 +1,25 @@
+"""
+gunicorn settings for the webhook listener. gunicorn reads this file
+automatically when started from this directory:
+
+    gunicorn wsgi:app
+
+Each webhook spends nearly all of its time waiting on NetBox and the network
+devices. The gevent worker class handles every webhook in a lightweight
+greenlet (a few KiB each) rather than an OS thread, switching to another
+webhook whenever one is waiting on the network. gevent patches the standard
+library, so the existing threads, queues, locks and sockets used by the
+application cooperate without any code changes.
+
+gevent runs its greenlets on a C event loop (libev by default, or libuv when
+the GEVENT_LOOP environment variable is set to "libuv"), so there is no
+pure-Python asyncio loop to replace with uvloop.
+"""
+# Listen on every IP address using the same port as the development server
+bind = "0.0.0.0:19703"
+
+# Number of worker processes, and the maximum number of webhooks each worker
+# process will handle concurrently
+workers = 4
+worker_class = "gevent"
+worker_connections = 1000
@@ -1,27 +1,68 @@
 """
 Functions used when a Webhook request is received for Netbox interface objects
 """
-# ipaddress is needed to parse incoming IP data
-import ipaddress
+# json is needed to pre-encode static RESTCONF payloads
+import json
+
+# logging is used to report progress - messages are only formatted if the
+#   configured log level will display them
+import logging
 
-# "g" represents a Flask app global variable which can be used throughout the
-#   applicaiton.
 # "request" represents the Flask received data
 # "Response" is an object that we can use to return an HTTP status code to the
 #   NetBox calling webhook.
-from flask import g, request, Response
+from flask import request, Response
+
+# Import the RESTCONF client object and the shared thread pool from config.py
+from config import restconf_client, io_executor
+
+# Import the function used to (batch) retrieve interface details from NetBox
+from netbox_batcher import batched_interface_get
+
+# ... And, import the functions to parse an interface name into a type and ID,
+#   get a device's management IP and build the RESTCONF URL for an interface
+from common_functions import (parse_interface_name,
+                              get_management_ip,
+                              build_interface_url)
+
+# Import the decorator used to skip duplicate webhooks
+from webhook_dedup import skip_duplicate_webhooks
 
-# Import the configured NetBox API object and the RESTCONF session object from
-#   config.py
-from config import netbox_api, restconf_session
+# Module logger, configured by main.py
+logger = logging.getLogger(__name__)
 
-# ... And, import the function to parse an interface name into a type and ID
-from common_functions import parse_interface_name
+# RESTCONF URL templates, relative to the base URL of the target interface
+_URL_SHUTDOWN = "%s/shutdown"
+_URL_DESCRIPTION = "%s/description"
+_URL_MTU = "%s/mtu"
 
+# Interface MTU to configure if no MTU is defined in NetBox
+DEFAULT_MTU = 1500
 
-def set_interface_status(netbox_interface_object):
+# RESTCONF payloads which never change are encoded to JSON once at import time
+# rather than for every request. The client already sends the matching
+# Content-Type header.
+_SHUTDOWN_BODY = json.dumps({"shutdown": [None]}).encode()
+_MTU_BODIES = {mtu: json.dumps({"mtu": mtu}).encode() for mtu in (DEFAULT_MTU, 9000)}
+
+
+class _Text:
     """
-    Given a pynetbox interface object, determine if this interface should be
+    Wrap a pre-encoded payload so that it is only decoded for a log message
+    if the message is actually formatted.
+    """
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        return self.payload.decode()
+
+
+def set_interface_status(netbox_interface_object, base_url):
+    """
+    Given the NetBox interface details, determine if this interface should be
     shutdown or not. Generate the appropriate RESTCONF payload and send as
     a patch.
 
@@ -32,31 +73,27 @@ def set_interface_status(netbox_interface_object):
     If an interface is already enabled and the DELETE payload is sent, a
     404 will be returned, indicating that there is nothing to delete.
 
-    :param netbox_interface_object: pynetbox interface object reference
+    :param netbox_interface_object: dict - NetBox interface details
+    :param base_url: string - RESTCONF base URL of the target interface
     :return: None
     """
-    interface_status = netbox_interface_object.enabled
+    interface_status = netbox_interface_object["enabled"]
 
-    url = f"{g.baseurl}/shutdown"
+    url = _URL_SHUTDOWN % base_url
 
     if interface_status:
-        url = f"{url}"
-        print(f"\tEnabling interface.\n\tTarget URL: {url}")
-        response = restconf_session.delete(url=url)
+        logger.debug("Enabling interface. Target URL: %s", url)
+        response = restconf_client.delete(url=url)
         if response.status_code == 404:
-            print(f"\tInterface {netbox_interface_object.name} is already enabled!")
+            logger.info("Interface %s is already enabled!", netbox_interface_object["name"])
     else:
-        payload = {
-            "shutdown": [
-                None
-            ]
-        }
-        print(f"\tDISabling interface.\n\tTarget URL: {url}\n\tPayload:\n\t{payload}")
-        response = restconf_session.put(url=url, json=payload)
-    print(f"\tResponse: {response.status_code} ({response.reason})\n")
+        logger.debug("DISabling interface. Target URL: %s Payload: %s",
+                     url, _Text(_SHUTDOWN_BODY))
+        response = restconf_client.put(url=url, content=_SHUTDOWN_BODY)
+    logger.debug("Response: %s (%s)", response.status_code, response.reason_phrase)
 
 
-def update_interface_description(netbox_interface_object):
+def update_interface_description(netbox_interface_object, base_url):
     """
     Change or remove the interface description, depending on what the desired
     state is from NetBox.
@@ -67,25 +104,26 @@ def update_interface_description(netbox_interface_object):
     If the interface description was removed (set to a null string), send
     an HTTP DELETE command to remove.
 
-    :param netbox_interface_object: pynetbox interface object reference
+    :param netbox_interface_object: dict - NetBox interface details
+    :param base_url: string - RESTCONF base URL of the target interface
     :return: None
     """
-    url = f"{g.baseurl}/description"
+    url = _URL_DESCRIPTION % base_url
 
-    if interface_description := netbox_interface_object.description:
+    if interface_description := netbox_interface_object["description"]:
         payload = {
             "description": interface_description
         }
-        print(f"\tSetting interface description to '{interface_description}'\n"
-              f"\tURL: {url}\n\tPayload:\n\t{payload}")
-        response = restconf_session.put(url=url, json=payload)
+        logger.debug("Setting interface description to '%s' URL: %s Payload: %s",
+                     interface_description, url, payload)
+        response = restconf_client.put(url=url, json=payload)
     else:
-        print(f"\tRemoving interface description.\n\tURL: {url}")
-        response = restconf_session.delete(url=url)
-    print(f"\tResponse: {response.status_code} ({response.reason})\n")
+        logger.debug("Removing interface description. URL: %s", url)
+        response = restconf_client.delete(url=url)
+    logger.debug("Response: %s (%s)", response.status_code, response.reason_phrase)
 
 
-def update_interface_mtu(netbox_interface_object):
+def update_interface_mtu(netbox_interface_object, base_url):
     """
     Set the interface MTU (note: not a TCP MSS or an IP MTU, the actual MTU
     allowed by the interface!).
@@ -95,27 +133,29 @@ def update_interface_mtu(netbox_interface_object):
     which is not covered here; a 1280-byte payload will be fine with an
     interface MTU of 1500 :-)
 
-    :param netbox_interface_object: pynetbox interface object reference
+    :param netbox_interface_object: dict - NetBox interface details
+    :param base_url: string - RESTCONF base URL of the target interface
     :return: None
     """
-    url = f"{g.baseurl}/mtu"
+    url = _URL_MTU % base_url
 
-    default_mtu = 1500
-
-    if desired_mtu := netbox_interface_object.mtu:
+    if desired_mtu := netbox_interface_object["mtu"]:
         mtu_payload = desired_mtu
     else:
-        mtu_payload = default_mtu
+        mtu_payload = DEFAULT_MTU
+
+    # Use the pre-encoded payload for common MTU values
+    if (payload := _MTU_BODIES.get(mtu_payload)) is None:
+        payload = json.dumps({"mtu": mtu_payload}).encode()
 
-    payload = {
-        "mtu": mtu_payload
-    }
-    print(f"\tSetting interface MTU to '{mtu_payload}'\n\tURL: {url}\n\tPayload:\n\t{payload}")
-    response = restconf_session.put(url=url, json=payload)
+    logger.debug("Setting interface MTU to '%s' URL: %s Payload: %s",
+                 mtu_payload, url, _Text(payload))
+    response = restconf_client.put(url=url, content=payload)
 
-    print(f"\tResponse: {response.status_code} ({response.reason})\n")
+    logger.debug("Response: %s (%s)", response.status_code, response.reason_phrase)
 
 
+@skip_duplicate_webhooks
 def manage_device_interface():
     """
     Function for the Webhook listener at the interface configuration path.
@@ -133,39 +173,49 @@ def manage_device_interface():
         if this succeeds or not, it's just sending data!
     """
 
-    # Get all the interface data from NetBox.
-    interface_data = netbox_api.dcim.interfaces.get(request.json["data"]["id"])
+    # Get all the interface data from NetBox. Lookups from webhooks arriving
+    # at the same time are combined into a single NetBox API call. The
+    # interface has just been changed, so cached details must not be used.
+    interface_data = batched_interface_get(request.json["data"]["id"], use_cache=False)
 
     # Split out the interface type and ID for RESTCONF operations. The YANG
     # model is expecting a list reference to identify the interface for
     # configuration in the format <interface_type>=<interface_id>. Call the
     # common function to parse the interface into separate type/id for use in
     # subsequent tasks.
-    interface_type, interface_id = parse_interface_name(interface_data.name)
+    interface_type, interface_id = parse_interface_name(interface_data["name"])
 
-    # Get the "primary_ip" of the device to configure. This is where RESTCONF
+    # Get the primary IPv4 address of the device to configure. This is where RESTCONF
     # requests will be send.
-    mgmt_ip = format(ipaddress.IPv4Interface(interface_data.device.primary_ip).ip)
+    mgmt_ip = get_management_ip(interface_data["device"]["primary_ip4"]["address"])
 
-    # The variable "g" is imported by Flask and represents a global variable which
-    # is accessible by any during the request. Every function in this module
-    # will use the same base URL, which includes the interface identifier.
-    g.baseurl = f"https://{mgmt_ip}/restconf/data/Cisco-IOS-XE-native:native/interface/" \
-                f"{interface_type}={interface_id}"
+    # Every function in this module will use the same base URL, which includes
+    # the interface identifier. Build it once and pass it to each function.
+    base_url = build_interface_url(mgmt_ip, interface_type, interface_id)
 
-    print(f"Configuring interface '{interface_data.name}' on device"
-          f" '{interface_data.device.name}'...")
+    logger.info("Configuring interface '%s' on device '%s'...",
+                interface_data["name"], interface_data["device"]["name"])
 
     # If this is the management interface, don't change it! Nothing worse than
     # killing your session because you moved the management interface in the
     # middle of a configuration task :-)
-    if interface_data.mgmt_only:
-        print("\tManagement interface, no changes will be performed...")
+    if interface_data["mgmt_only"]:
+        logger.info("Management interface, no changes will be performed...")
     else:
-        # Magic happens here - set the status, description, and MTU.
-        set_interface_status(netbox_interface_object=interface_data)
-        update_interface_description(netbox_interface_object=interface_data)
-        update_interface_mtu(netbox_interface_object=interface_data)
+        # Magic happens here - set the status, description, and MTU. Each task
+        # modifies a separate part of the interface configuration, so the
+        # RESTCONF requests are sent in parallel using the shared thread pool.
+        interface_tasks = [
+            io_executor.submit(task,
+                               netbox_interface_object=interface_data,
+                               base_url=base_url)
+            for task in (set_interface_status,
+                         update_interface_description,
+                         update_interface_mtu)
+        ]
+        # Wait for every task to complete (re-raising any exception)
+        for interface_task in interface_tasks:
+            interface_task.result()
 
     # Return a generic 204 response to the NetBox webhook
     return Response(status=204)
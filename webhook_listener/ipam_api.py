@@ -5,37 +5,57 @@ Management) objects
 # ipaddress is needed to parse incoming IP data
 import ipaddress
 
-# "g" represents a Flask app global variable which can be used throughout the
-#   application.
+# logging is used to report progress - messages are only formatted if the
+#   configured log level will display them
+import logging
+
 # "request" represents the Flask received data
 # "Response" is an object that we can use to return an HTTP status code to the
 #   NetBox calling webhook.
-from flask import g, request, Response
+from flask import request, Response
+
+# Import the RESTCONF client object and the shared thread pool from config.py
+from config import restconf_client, io_executor
+
+# Import the function used to (batch) retrieve interface details from NetBox
+from netbox_batcher import batched_interface_get
 
-# Import the configured NetBox API object and the RESTCONF session object from
-#   config.py
-from config import netbox_api, restconf_session
+# ... And, import the functions to parse an interface name into a type and ID,
+#   get a device's management IP and build the RESTCONF URL for an interface
+from common_functions import (parse_interface_name,
+                              get_management_ip,
+                              build_interface_url)
 
-# ... And, import the function to parse an interface name into a type and ID
-from common_functions import parse_interface_name
+# Import the decorator used to skip duplicate webhooks
+from webhook_dedup import skip_duplicate_webhooks
 
+# Module logger, configured by main.py
+logger = logging.getLogger(__name__)
 
-def configure_interface_ipv4_address(ip_address):
+# RESTCONF URL templates, relative to the base URL of the target interface
+_URL_IPV4_PRIMARY = "%s/ip/address/primary"
+_URL_IPV6_LIST = "%s/ipv6/address/prefix-list"
+_URL_IPV6_PREFIX = "%s/ipv6/address/prefix-list=%s"
+
+
+def configure_interface_ipv4_address(base_url, ip_address):
     """
     Configure an interface's primary IPv4 address.
 
+    :param base_url: string - RESTCONF base URL of the target interface
     :param ip_address: IPv4 address in CIDR notation (IP/Prefix)
     :return: Flask HTTP/204 Response object
     """
 
     # Convert the CIDR notation into an IPv4Interface object, allowing easy
     # parsing of the address components
-    ip4_address = format(ipaddress.IPv4Interface(ip_address).ip)
-    ip4_netmask = format(ipaddress.IPv4Interface(ip_address).netmask)
+    ip4_interface = ipaddress.IPv4Interface(ip_address)
+    ip4_address = str(ip4_interface.ip)
+    ip4_netmask = str(ip4_interface.netmask)
 
-    # Build the target URL from the Flask "g" global variable containing the
-    # base URL of the device and interface to be modified
-    url = f"{g.base_url}/ip/address/primary"
+    # Build the target URL from the base URL of the device and interface to be
+    # modified
+    url = _URL_IPV4_PRIMARY % base_url
 
     payload = {
         "primary": {
@@ -44,20 +64,21 @@ def configure_interface_ipv4_address(ip_address):
         }
     }
 
-    print(f"Sending payload:\n\t{payload}\nTo URL:\n\t{url}")
-    response = restconf_session.patch(url=url, json=payload)
-    print(f"\tResponse: {response.status_code} ({response.reason})")
+    logger.debug("Sending payload: %s To URL: %s", payload, url)
+    response = restconf_client.patch(url=url, json=payload)
+    logger.debug("Response: %s (%s)", response.status_code, response.reason_phrase)
 
 
-def configure_interface_ipv6_address(ip_address):
+def configure_interface_ipv6_address(base_url, ip_address):
     """
     Because an interface may have multiple IPv6 addresses assigned, add the
     desired IPv6 address to the list of addresses on the target interface.
 
+    :param base_url: string - RESTCONF base URL of the target interface
     :param ip_address: IPv6 address with prefix
     :return: Flask HTTP/204 Response object
     """
-    url = f"{g.base_url}/ipv6/address/prefix-list"
+    url = _URL_IPV6_LIST % base_url
 
     payload = {
         "prefix-list": [
@@ -66,9 +87,17 @@ def configure_interface_ipv6_address(ip_address):
             }
         ]
     }
-    print(f"Sending payload:\n\t{payload}\nTo URL:\n\t{url}")
-    response = restconf_session.patch(url=url, json=payload)
-    print(f"\tResponse: {response.status_code} ({response.reason})")
+    logger.debug("Sending payload: %s To URL: %s", payload, url)
+    response = restconf_client.patch(url=url, json=payload)
+    logger.debug("Response: %s (%s)", response.status_code, response.reason_phrase)
+
+
+# Functions to configure an address on an interface, keyed by address family.
+# Each function is called with the interface base URL and the IP address.
+CONFIGURE_ADDRESS_FUNCTIONS = {
+    4: configure_interface_ipv4_address,
+    6: configure_interface_ipv6_address
+}
 
 
 def configure_ip_address(netbox_interface_object, ip_address, address_family):
@@ -79,56 +108,54 @@ def configure_ip_address(netbox_interface_object, ip_address, address_family):
     all other relevant details such as the device management IP can be
     gleaned from the NetBox interface object reference.
 
-    :param netbox_interface_object: pynetbox interface object reference
+    :param netbox_interface_object: dict - NetBox interface details
     :param ip_address: string - IPv4 or IPv6 address
     :param address_family: int - 4 or 6 to match the IP family
     :return: None
     """
 
     # Parse the interface type and ID for RESTCONF URL generation
-    interface_type, interface_id = parse_interface_name(netbox_interface_object.name)
+    interface_type, interface_id = parse_interface_name(netbox_interface_object["name"])
 
-    # Grab the management IP from the pynetbox interface object. Note that this
+    # Grab the management IP from the NetBox interface details. Note that this
     # is targeting the IPv4 primary IP address, so will be wrapped into an
     # ipaddress.IPv4Interface object for easy extraction of the address
-    # component
-    mgmt_ip = format(ipaddress.IPv4Interface(netbox_interface_object.device.primary_ip).ip)
+    # component (the result is cached per primary IP address)
+    mgmt_ip = get_management_ip(netbox_interface_object["device"]["primary_ip4"]["address"])
 
     # Generate the base URL for RESTCONF requests against the desired interface
-    # Note that the Flask "g" global variable is used here to store the URL.
-    g.base_url = f"https://{mgmt_ip}/restconf/data/Cisco-IOS-XE-native:native/interface/" \
-                 f"{interface_type}={interface_id}"
+    base_url = build_interface_url(mgmt_ip, interface_type, interface_id)
 
-    print(f"Assigning address {ip_address} "
-          f"to interface '{netbox_interface_object.name}' "
-          f"on device '{netbox_interface_object.device.name}'...")
+    logger.info("Assigning address %s to interface '%s' on device '%s'...",
+                ip_address,
+                netbox_interface_object["name"],
+                netbox_interface_object["device"]["name"])
 
     # Configure the address using the matching AF function
-    if address_family == 6:
-        configure_interface_ipv6_address(ip_address)
-    else:
-        configure_interface_ipv4_address(ip_address)
+    CONFIGURE_ADDRESS_FUNCTIONS[address_family](base_url, ip_address)
 
 
-def unconfigure_interface_ipv4_address():
+def unconfigure_interface_ipv4_address(base_url):
     """
-    Delete the primary IPv4 address from an interface. No parameters are needed
-    as an HTTP DELETE is performed against the primary address RESTCONF
+    Delete the primary IPv4 address from an interface. Only the base URL is
+    needed as an HTTP DELETE is performed against the primary address RESTCONF
     endpoint for the device interface
 
+    :param base_url: string - RESTCONF base URL of the target interface
     :return: None
     """
-    url = f"{g.base_url}/ip/address/primary"
+    url = _URL_IPV4_PRIMARY % base_url
 
-    response = restconf_session.delete(url=url)
-    print(f"\tResponse: {response.status_code} ({response.reason})")
+    response = restconf_client.delete(url=url)
+    logger.debug("Response: %s (%s)", response.status_code, response.reason_phrase)
 
 
-def unconfigure_interface_ipv6_address(ip_address):
+def unconfigure_interface_ipv6_address(base_url, ip_address):
     """
     Remove the provided IPv6 address from the list of IPv6 prefixes on an
     interface.
 
+    :param base_url: string - RESTCONF base URL of the target interface
     :param ip_address: string - IPv6 address to remove from the interface
     :return: None
     """
@@ -136,10 +163,19 @@ def unconfigure_interface_ipv6_address(ip_address):
     # "%2F" to avoid it being interpreted as part of the RESTCONF target
     # URL.
     formatted_address = format(ip_address).replace("/", "%2F")
-    url = f"{g.base_url}/ipv6/address/prefix-list={formatted_address}"
-    response = restconf_session.delete(url=url)
+    url = _URL_IPV6_PREFIX % (base_url, formatted_address)
+    response = restconf_client.delete(url=url)
+
+    logger.debug("Response: %s (%s)", response.status_code, response.reason_phrase)
+
 
-    print(f"\tResponse: {response.status_code} ({response.reason})")
+# Functions to remove an address from an interface, keyed by address family.
+# Each function is called with the interface base URL and the IP address (the
+# primary IPv4 address is removed without needing the address itself).
+UNCONFIGURE_ADDRESS_FUNCTIONS = {
+    4: lambda base_url, ip_address: unconfigure_interface_ipv4_address(base_url),
+    6: unconfigure_interface_ipv6_address
+}
 
 
 def unconfigure_ip_address(netbox_interface_object, ip_address, address_family):
@@ -148,26 +184,24 @@ def unconfigure_ip_address(netbox_interface_object, ip_address, address_family):
     address family, call the appropriate function to unconfigure the
     v4 or v6 address.
 
-    :param netbox_interface_object: pynetbox interface object reference
+    :param netbox_interface_object: dict - NetBox interface details
     :param ip_address: string - IP address in CIDR notation
     :param address_family: int - IP address family (4|6)
     :return: None
     """
 
-    interface_type, interface_id = parse_interface_name(netbox_interface_object.name)
-    mgmt_ip = format(ipaddress.IPv4Interface(netbox_interface_object.device.primary_ip).ip)
+    interface_type, interface_id = parse_interface_name(netbox_interface_object["name"])
+    mgmt_ip = get_management_ip(netbox_interface_object["device"]["primary_ip4"]["address"])
 
-    g.base_url = f"https://{mgmt_ip}/restconf/data/Cisco-IOS-XE-native:native/interface/" \
-                 f"{interface_type}={interface_id}"
+    base_url = build_interface_url(mgmt_ip, interface_type, interface_id)
 
-    print(f"Removing address {ip_address} "
-          f"from interface '{netbox_interface_object.name}' "
-          f"on device '{netbox_interface_object.device.name}'...")
+    logger.info("Removing address %s from interface '%s' on device '%s'...",
+                ip_address,
+                netbox_interface_object["name"],
+                netbox_interface_object["device"]["name"])
 
-    if address_family == 6:
-        unconfigure_interface_ipv6_address(ip_address)
-    else:
-        unconfigure_interface_ipv4_address()
+    # Unconfigure the address using the matching AF function
+    UNCONFIGURE_ADDRESS_FUNCTIONS[address_family](base_url, ip_address)
 
 
 def update_ip_address(netbox_interface_object, snapshot_json, ip_address, address_family):
@@ -183,42 +217,66 @@ def update_ip_address(netbox_interface_object, snapshot_json, ip_address, addres
 
     If the presnapshot data differs from the target interface, unconfigure the
     previously-configured interface before configuring the address on the
-    target.
+    target. If the previous interface is on a different device, there is no
+    dependency between the two changes, so the address is unconfigured from
+    the previous device in parallel with configuring the target.
 
-    :param netbox_interface_object: pynetbox interface object reference
+    :param netbox_interface_object: dict - NetBox interface details
     :param snapshot_json: Contents of the webhook "snapshot" payload
     :param ip_address: string - IP address in CIDR notation
     :param address_family: int - IP address family (4|6)
     :return: None
     """
-    print("Updating IP address...")
+    logger.info("Updating IP address...")
+
+    # Background task which unconfigures the address from a different device
+    unconfigure_task = None
 
     # If the snapshot_json is not None, the snapshot must be compared to the
-    # webhook data contained in the pynetbox interface object reference.
+    # interface details retrieved from NetBox.
     if snapshot_json:
         try:
             old_interface_id = snapshot_json["prechange"]["assigned_object_id"]
 
-            if old_interface_id != netbox_interface_object.id:
-                # Old assignment is on a different interface. Unconfigure
-                # before configuring the new device.
-                old_interface_data = netbox_api.dcim.interfaces.get(old_interface_id)
-                if not old_interface_data.mgmt_only:
-                    unconfigure_ip_address(netbox_interface_object=old_interface_data,
-                                           ip_address=ip_address,
-                                           address_family=address_family)
-        except AttributeError:
-            print("Address not previously assigned")
-        except ValueError:
-            print("Address not previously assigned")
-
-    # Regardless of the previous address assignment, it is time to configure
-    # the address on the target interface...
-    configure_ip_address(netbox_interface_object=netbox_interface_object,
-                         ip_address=ip_address,
-                         address_family=address_family)
-
-
+            if old_interface_id != netbox_interface_object["id"]:
+                # Old assignment is on a different interface, which must be
+                # unconfigured. On the same device this happens before the
+                # new interface is configured; on a different device it runs
+                # in parallel with configuring the new device.
+                old_interface_data = batched_interface_get(old_interface_id)
+                if not old_interface_data["mgmt_only"]:
+                    old_device_id = old_interface_data["device"]["id"]
+                    if old_device_id == netbox_interface_object["device"]["id"]:
+                        # Same device - the address must be removed first,
+                        # otherwise the device rejects it as overlapping with
+                        # the previous interface.
+                        unconfigure_ip_address(netbox_interface_object=old_interface_data,
+                                               ip_address=ip_address,
+                                               address_family=address_family)
+                    else:
+                        unconfigure_task = io_executor.submit(
+                            unconfigure_ip_address,
+                            netbox_interface_object=old_interface_data,
+                            ip_address=ip_address,
+                            address_family=address_family
+                        )
+        except (TypeError, ValueError):
+            logger.info("Address not previously assigned")
+
+    try:
+        # Regardless of the previous address assignment, it is time to configure
+        # the address on the target interface...
+        configure_ip_address(netbox_interface_object=netbox_interface_object,
+                             ip_address=ip_address,
+                             address_family=address_family)
+    finally:
+        # Wait for the previous device to be unconfigured (re-raising any
+        # exception), even if configuring the target interface failed
+        if unconfigure_task:
+            unconfigure_task.result()
+
+
+@skip_duplicate_webhooks
 def manage_interface_ip_address():
     """
     Function for the Webhook listener at the IPAM configuration path.
@@ -243,10 +301,10 @@ def manage_interface_ip_address():
         # and determine what type of request this is (created, updated, deleted)
         # to perform the expected action.
 
-        assigned_interface_details = netbox_api.dcim.interfaces.get(assigned_interface)
+        assigned_interface_details = batched_interface_get(assigned_interface)
 
-        if assigned_interface_details.mgmt_only:
-            print("\tManagement interface, no changes will be performed...")
+        if assigned_interface_details["mgmt_only"]:
+            logger.info("Management interface, no changes will be performed...")
         else:
 
             if request.json["event"] == "deleted":
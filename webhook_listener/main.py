@@ -3,11 +3,20 @@ Main webhook listener entrypoint. Initialize the Flask app which will listen
 for incoming Netbox webhooks and add URL rules to process webhook data sent
 to specific URL endpoints
 """
-# Import Flask to act as the main webhook listener
+# logging is used by the webhook handlers to report progress
+import logging
+
+# orjson is a fast JSON library, used to decode incoming webhook payloads
+import orjson
+
+# Import Flask to act as the main webhook listener, and the base class used to
+# replace the JSON library used by Flask
 from flask import Flask
+from flask.json.provider import JSONProvider
 
-# Include the conditional "urllib3" TLS warning disable function
-from config import conditionally_disable_tls_warnings
+# Include the conditional "urllib3" TLS warning disable function and the
+# logging settings
+from config import conditionally_disable_tls_warnings, LOG_LEVEL, LOG_FORMAT
 
 # There will be two API endpoints created for interfaces and IPAM. Import
 # the needed functions from separate Python files which will handle request
@@ -18,8 +27,26 @@ from ipam_api import manage_interface_ip_address
 # Disable "insecure HTTPS" messages if no validation is to be performed
 conditionally_disable_tls_warnings()
 
+# Configure the root logger - every module logs through it
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Flask JSON provider which uses orjson rather than the standard library
+    json module. Webhook payloads (request.json) can be several KiB when
+    NetBox includes the pre/post change snapshots.
+    """
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # Create the initial Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # URLs to be included. "add_url_rule" is a Flask method to specify the target
 # API endpoint, the allowed methods, and which function will process incoming
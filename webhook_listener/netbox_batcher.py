@@ -0,0 +1,242 @@
+"""
+Coalesce NetBox interface lookups from concurrent webhooks into a single
+NetBox API request.
+
+When several webhooks arrive at (nearly) the same time, such as after a bulk
+edit in NetBox, each one needs to retrieve interface details from NetBox.
+Instead of sending one API request per webhook, lookups are placed into a
+queue. A background thread collects queued lookups for a short time window
+into a batch. A small thread pool retrieves all the interfaces requested by a
+batch with a single GraphQL query, then hands each result back to the waiting
+webhook. Several batches can be retrieved at once, so a slow NetBox API call
+only delays the lookups in its own batch.
+
+The GraphQL query requests only the interface fields used by the webhook
+handlers. Retrieving an interface from the REST API makes NetBox serialize
+the complete interface (cable, link peers, connected endpoints, etc.), which
+requires many additional database queries.
+
+Retrieved interfaces are also cached for a few seconds, so repeated lookups
+of the same interface do not need to contact NetBox at all.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import time
+
+from cachetools import TTLCache
+
+# Import the configured NetBox session object, GraphQL URL, timeout, pool size
+# and cache settings from config.py
+from config import (netbox_session,
+                    NETBOX_GRAPHQL_URL,
+                    NETBOX_TIMEOUT,
+                    NETBOX_POOL_SIZE,
+                    INTERFACE_CACHE_TTL,
+                    INTERFACE_CACHE_MAX_ENTRIES)
+
+# Maximum time (in seconds) to wait for more lookups before sending a batch
+BATCH_WINDOW = 0.02
+
+# Maximum number of interface lookups to send in a single NetBox API call
+BATCH_MAX_SIZE = 50
+
+# GraphQL query to retrieve the required details for a list of interface IDs
+INTERFACE_QUERY = """
+query ($interface_ids: [String]) {
+  interface_list(id: $interface_ids) {
+    id
+    name
+    enabled
+    description
+    mtu
+    mgmt_only
+    device {
+      id
+      name
+      primary_ip4 {
+        address
+      }
+    }
+  }
+}
+"""
+
+
+class InterfaceLookup:
+    """
+    A single pending interface lookup. The webhook thread waits on the
+    "done" event, which is set by the batch thread once the result (or an
+    error) is available.
+    """
+    def __init__(self, interface_id):
+        self.interface_id = interface_id
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Queue of pending InterfaceLookup objects and the thread which processes them
+pending_lookups = queue.Queue()
+batch_thread = None
+batch_thread_lock = threading.Lock()
+
+# Thread pool which sends the NetBox API call for each batch. One thread per
+# pooled NetBox connection, so that every keep-alive connection can be used.
+fetch_executor = ThreadPoolExecutor(max_workers=NETBOX_POOL_SIZE,
+                                    thread_name_prefix="netbox-fetch")
+
+# Recently retrieved interface details, keyed by interface ID. The cache is
+# shared by every request thread, so access is protected by a lock.
+interface_cache = TTLCache(maxsize=INTERFACE_CACHE_MAX_ENTRIES, ttl=INTERFACE_CACHE_TTL)
+interface_cache_lock = threading.Lock()
+
+
+def collect_batch():
+    """
+    Wait for a pending lookup, then keep collecting lookups until either the
+    batch window expires or the maximum batch size is reached.
+
+    :return: List of InterfaceLookup objects
+    """
+    batch = [pending_lookups.get()]
+    deadline = time.monotonic() + BATCH_WINDOW
+
+    while len(batch) < BATCH_MAX_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(pending_lookups.get(timeout=remaining))
+        except queue.Empty:
+            break
+
+    return batch
+
+
+def fetch_interfaces(interface_ids):
+    """
+    Retrieve the details of several interfaces with a single NetBox GraphQL
+    query.
+
+    :param interface_ids: List of NetBox interface IDs
+    :return: Dict of interface details (dicts), keyed by interface ID
+    """
+    response = netbox_session.post(
+        url=NETBOX_GRAPHQL_URL,
+        json={
+            "query": INTERFACE_QUERY,
+            "variables": {
+                "interface_ids": [str(interface_id) for interface_id in interface_ids]
+            }
+        },
+        timeout=NETBOX_TIMEOUT
+    )
+    response.raise_for_status()
+    result = response.json()
+
+    # GraphQL reports query errors in the response body rather than with an
+    # HTTP status code
+    if errors := result.get("errors"):
+        raise RuntimeError(f"NetBox GraphQL query failed: {errors}")
+
+    interfaces = {}
+    for interface in result["data"]["interface_list"]:
+        # GraphQL IDs are strings, but webhook payloads use integer IDs
+        interface["id"] = int(interface["id"])
+        interface["device"]["id"] = int(interface["device"]["id"])
+        interfaces[interface["id"]] = interface
+
+    return interfaces
+
+
+def process_batch(batch):
+    """
+    Retrieve every interface in the batch using a single NetBox API call and
+    pass each result back to the waiting lookup. Interfaces which do not exist
+    in NetBox will return None.
+
+    :param batch: List of InterfaceLookup objects
+    :return: None
+    """
+    interface_ids = list({lookup.interface_id for lookup in batch})
+
+    try:
+        interfaces = fetch_interfaces(interface_ids)
+    except Exception as err:  # pylint: disable=broad-except
+        # Any error (NetBox unreachable, authentication, etc.) must be
+        # handed back to the webhook threads, otherwise they would wait
+        # forever.
+        for lookup in batch:
+            lookup.error = err
+            lookup.done.set()
+        return
+
+    with interface_cache_lock:
+        interface_cache.update(interfaces)
+
+    for lookup in batch:
+        lookup.result = interfaces.get(lookup.interface_id)
+        lookup.done.set()
+
+
+def process_batches():
+    """
+    Batch thread main loop. Collect pending lookups into batches and hand each
+    batch to the fetch thread pool, so that several NetBox API calls can be in
+    flight at once and a slow call only delays the lookups in its own batch.
+
+    :return: None
+    """
+    while True:
+        fetch_executor.submit(process_batch, collect_batch())
+
+
+def start_batch_thread():
+    """
+    Start the batch thread if it is not already running. The thread is
+    started on first use (rather than at import time) so that each process
+    started by a forking WSGI server runs its own batch thread.
+
+    :return: None
+    """
+    global batch_thread  # pylint: disable=global-statement
+
+    with batch_thread_lock:
+        if batch_thread is None or not batch_thread.is_alive():
+            batch_thread = threading.Thread(target=process_batches,
+                                            name="netbox-batcher",
+                                            daemon=True)
+            batch_thread.start()
+
+
+def batched_interface_get(interface_id, use_cache=True):
+    """
+    Retrieve the details of a NetBox interface. Recently retrieved interfaces
+    are returned from the cache, otherwise queue the lookup for the batch
+    thread and block until the result is available.
+
+    :param interface_id: int - NetBox ID of the interface
+    :param use_cache: Boolean - set to False if the interface is known to have
+        changed, to always retrieve (and cache) the current details
+    :return: dict - NetBox interface details, or None if not found
+    """
+    if not interface_id:
+        raise ValueError("An interface ID is required")
+
+    if use_cache:
+        with interface_cache_lock:
+            interface = interface_cache.get(interface_id)
+        if interface is not None:
+            return interface
+
+    start_batch_thread()
+
+    lookup = InterfaceLookup(interface_id)
+    pending_lookups.put(lookup)
+    lookup.done.wait()
+
+    if lookup.error:
+        raise lookup.error
+
+    return lookup.result
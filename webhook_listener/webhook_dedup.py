@@ -0,0 +1,111 @@
+"""
+Detect duplicate webhooks.
+
+NetBox may send the same webhook several times in quick succession. Recently
+received webhooks are remembered for a short time, so that identical webhooks
+received afterwards can be acknowledged without configuring the device again.
+"""
+import functools
+import hashlib
+import logging
+import threading
+
+from cachetools import TTLCache
+import orjson
+
+# "request" represents the Flask received data
+# "Response" is an object that we can use to return an HTTP status code to the
+#   NetBox calling webhook.
+from flask import request, Response
+
+from config import DUPLICATE_WEBHOOK_TTL, DUPLICATE_WEBHOOK_MAX_ENTRIES
+
+# Module logger, configured by main.py
+logger = logging.getLogger(__name__)
+
+# Recently received webhooks. Entries expire automatically after
+# DUPLICATE_WEBHOOK_TTL seconds. The cache is shared by every request thread,
+# so access is protected by a lock.
+recent_webhooks = TTLCache(maxsize=DUPLICATE_WEBHOOK_MAX_ENTRIES, ttl=DUPLICATE_WEBHOOK_TTL)
+recent_webhooks_lock = threading.Lock()
+
+
+def _webhook_key(endpoint, webhook_json):
+    """
+    Build the key used to identify a webhook: the endpoint, object ID, event
+    and a hash of the object data.
+
+    :param endpoint: String - name of the endpoint which received the webhook
+    :param webhook_json: Dict - the received webhook payload
+    :return: Tuple - key identifying the webhook
+    """
+    webhook_data = webhook_json["data"]
+    data_hash = hashlib.blake2b(orjson.dumps(webhook_data, option=orjson.OPT_SORT_KEYS),
+                                digest_size=8).digest()
+    return endpoint, webhook_data["id"], webhook_json["event"], data_hash
+
+
+def is_duplicate_webhook(endpoint, webhook_json):
+    """
+    Determine whether an identical webhook (same endpoint, object ID, event
+    and object data) was received recently. The webhook is remembered so that
+    any identical webhooks received afterwards are reported as duplicates.
+    If processing the webhook fails, call forget_webhook() so that NetBox can
+    redeliver it.
+
+    :param endpoint: String - name of the endpoint which received the webhook
+    :param webhook_json: Dict - the received webhook payload
+    :return: Boolean - True if an identical webhook was received recently
+    """
+    webhook_key = _webhook_key(endpoint, webhook_json)
+
+    with recent_webhooks_lock:
+        if webhook_key in recent_webhooks:
+            return True
+        recent_webhooks[webhook_key] = True
+
+    return False
+
+
+def forget_webhook(endpoint, webhook_json):
+    """
+    Remove a webhook remembered by is_duplicate_webhook(), so that an
+    identical webhook received afterwards is processed again. Used when
+    processing the webhook failed.
+
+    :param endpoint: String - name of the endpoint which received the webhook
+    :param webhook_json: Dict - the received webhook payload
+    :return: None
+    """
+    webhook_key = _webhook_key(endpoint, webhook_json)
+
+    with recent_webhooks_lock:
+        recent_webhooks.pop(webhook_key, None)
+
+
+def skip_duplicate_webhooks(view_func):
+    """
+    Decorator for webhook view functions. If an identical webhook was received
+    recently, return a 204 response without calling the view function. If the
+    view function raises an exception, the change was not applied, so the
+    webhook is forgotten and an identical webhook redelivered by NetBox will
+    be processed again.
+
+    :param view_func: Flask view function handling the webhook
+    :return: Wrapped view function
+    """
+    endpoint = view_func.__module__
+
+    @functools.wraps(view_func)
+    def wrapper(*args, **kwargs):
+        if is_duplicate_webhook(endpoint, request.json):
+            logger.info("Duplicate webhook received, no changes will be performed...")
+            return Response(status=204)
+
+        try:
+            return view_func(*args, **kwargs)
+        except Exception:
+            forget_webhook(endpoint, request.json)
+            raise
+
+    return wrapper
@@ -0,0 +1,14 @@
+"""
+WSGI entrypoint for running the webhook listener under a production WSGI
+server such as gunicorn. The Flask development server started by main.py
+should only be used for testing.
+
+Server settings (worker processes, gevent worker class, listening port) are
+read from gunicorn.conf.py:
+
+    gunicorn wsgi:app
+"""
+# Import the fully-configured Flask app (URL rules are added in main.py)
+from main import app
+
+__all__ = ["app"]